@@ -7,31 +7,122 @@ from flask import Flask, request, jsonify
 import psutil
 import subprocess
 import threading
-from dotenv import load_dotenv
+import mmap
+import struct
+import zlib
+import json
+import array
+import gzip
+import collections
+import signal
+import sys
+import re
+from dotenv import dotenv_values
 from flask_cors import CORS
 
 ##PRODUCTION##
-load_dotenv()
-
-#ENVIRONMENT VARIABLES
-ID_DEVICE = os.getenv("ID_DEVICE")
-TOKEN_API = os.getenv("TOKEN_API")
-INVOICE_API = os.getenv("INVOICE_API")
-BILL_API = os.getenv("BILL_API")
-LOG_DIR = os.getenv("LOG_DIR")
-PORT = int(os.getenv("PORT"))
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ENV_FILE = os.getenv("CONFIG_FILE", os.path.join(BASE_DIR, ".env"))
+
+# CONFIGURATION (.env / CONFIG_FILE)
+# key: (parser, default, bisa di-reload tanpa restart)
+def parse_bool(value):
+    return str(value).lower() in ("1", "true", "yes", "on")
+
+CONSOLE_LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40}
+
+def parse_level(value):
+    if value.lower() not in CONSOLE_LEVELS:
+        raise ValueError(value)
+    return value.lower()
+
+CONFIG_FIELDS = {
+    "ID_DEVICE": (str, None, False),
+    "TOKEN_API": (str, None, True),
+    "INVOICE_API": (str, None, True),
+    "BILL_API": (str, None, True),
+    "LOG_DIR": (str, None, False),
+    "PORT": (int, None, False),
+    "TIMEOUT": (int, 180, True),
+    "MAX_RETRY": (int, 0, True),
+    "DEBOUNCE_TIME": (float, 0.05, True),
+    "NOTE_GAP": (float, 2, True),
+    "PULSE_TRACE": (parse_bool, False, False),
+    "DENOM_PROFILE": (str, "default", True),
+    "DENOM_PROFILE_FILE": (str, os.path.join(BASE_DIR, "denominations.json"), True),
+    "ADMIN_TOKEN": (str, None, True),
+    "TELEMETRY_URL": (str, None, False),
+    "TELEMETRY_TOKEN": (str, None, True),
+    "TELEMETRY_INTERVAL": (int, 20, True),
+    "CONSOLE_LEVEL": (parse_level, "info", True),
+}
+SECRET_FIELDS = ("ADMIN_TOKEN", "TELEMETRY_TOKEN")
+Config = collections.namedtuple("Config", CONFIG_FIELDS)
+
+def load_config(path=ENV_FILE):
+    """Membaca dan memvalidasi konfigurasi dari environment dan file .env. Raise ValueError jika tidak valid.
+
+    Seperti load_dotenv(): variabel environment proses didahulukan, lalu .env. Key yang ada di .env
+    dengan nilai kosong berarti nilai default.
+    """
+    values = dotenv_values(path) if os.path.exists(path) else {}
+    parsed, errors = {}, []
+
+    for key, (parser, default, _) in CONFIG_FIELDS.items():
+        raw = os.environ[key] if key in os.environ else values.get(key)
+        if raw in (None, ""):
+            parsed[key] = default
+            continue
+        try:
+            parsed[key] = parser(raw)
+        except ValueError:
+            errors.append(f"{key}={raw!r} tidak valid")
+
+    for key in ("TOKEN_API", "INVOICE_API", "BILL_API", "LOG_DIR", "PORT"):
+        if parsed.get(key) is None and not any(e.startswith(key + "=") for e in errors):
+            errors.append(f"{key} wajib diisi")
+    for key in ("TOKEN_API", "INVOICE_API", "BILL_API", "TELEMETRY_URL"):
+        if parsed.get(key) and not parsed[key].startswith(("http://", "https://")):
+            errors.append(f"{key} harus berupa URL http(s)")
+    # Collector menyimpan data per ID_DEVICE (lihat DEVICE_PATTERN di telemetry_collector.py)
+    if parsed.get("TELEMETRY_URL") and not re.match(r"^[A-Za-z0-9][A-Za-z0-9_.-]*$", parsed.get("ID_DEVICE") or ""):
+        errors.append("ID_DEVICE wajib diisi (huruf, angka, _ . -) jika TELEMETRY_URL diisi")
+    if not errors:
+        if parsed["TIMEOUT"] <= 0 or parsed["MAX_RETRY"] < 0 or parsed["TELEMETRY_INTERVAL"] < 1:
+            errors.append("TIMEOUT harus > 0, MAX_RETRY >= 0, TELEMETRY_INTERVAL >= 1")
+        if not 0 < parsed["DEBOUNCE_TIME"] < parsed["NOTE_GAP"]:
+            errors.append("harus berlaku 0 < DEBOUNCE_TIME < NOTE_GAP")
+
+    if errors:
+        raise ValueError("; ".join(errors))
+    return Config(**parsed)
+
+try:
+    config = load_config()
+except ValueError as e:
+    print(f" Konfigurasi tidak valid ({ENV_FILE}): {e}")
+    exit(1)
+pending_config = None
+pending_profile = None
+
+#ENVIRONMENT VARIABLES (hanya dibaca saat startup)
+ID_DEVICE = config.ID_DEVICE
+LOG_DIR = config.LOG_DIR
+PORT = config.PORT
 LOG_FILE = os.path.join(LOG_DIR, "log.txt")
 LOG_TRANS = os.path.join(LOG_DIR, "logpayment.txt")
+SNAPSHOT_FILE = os.path.join(LOG_DIR, "transaction.snap")
+PULSE_TRACE = config.PULSE_TRACE
+PULSE_TRACE_DIR = os.path.join(LOG_DIR, "pulsetrace")
+TELEMETRY_URL = config.TELEMETRY_URL
+TELEMETRY_SPOOL_DIR = os.path.join(LOG_DIR, "telemetry_spool")
 
 # PIN CONFIGURATION
 BILL_ACCEPTOR_PIN = 14
 EN_PIN = 15
 
-# TRANSACTION CONFIGURATION
-TIMEOUT = 180
-DEBOUNCE_TIME = 0.05
+# TRANSACTION CONFIGURATION (TIMEOUT, DEBOUNCE_TIME, NOTE_GAP, MAX_RETRY ada di config)
 TOLERANCE = 2
-MAX_RETRY = 0 
 
 # MAPPING PULSE TO MONEY
 PULSE_MAPPING = {
@@ -44,9 +135,23 @@ PULSE_MAPPING = {
     100: 100000
 }
 
+# DEFAULT DENOMINATION PROFILE (dipakai jika DENOM_PROFILE_FILE tidak ada)
+DEFAULT_PROFILE = {
+    "tolerance": TOLERANCE,
+    "pulses": PULSE_MAPPING,
+    "exact": [1],
+    "overrides": {3: 2, 4: 2}
+}
+
 if not os.path.exists(LOG_DIR):
     os.makedirs(LOG_DIR)
 
+if PULSE_TRACE and not os.path.exists(PULSE_TRACE_DIR):
+    os.makedirs(PULSE_TRACE_DIR)
+
+if TELEMETRY_URL and not os.path.exists(TELEMETRY_SPOOL_DIR):
+    os.makedirs(TELEMETRY_SPOOL_DIR)
+
 # FLASK APP INITIALIZATION
 app = Flask(__name__)
 CORS(app)
@@ -66,31 +171,200 @@ insufficient_payment_count = 0
 transaction_lock = threading.Lock()
 log_lock = threading.Lock()
 print_lock = threading.Lock()
+snapshot_lock = threading.Lock()
+decode_table = ()
+denom_profile_name = None
+misread_count = 0
+telemetry_records = collections.deque(maxlen=5000)
+telemetry_metrics = {"transactions": 0, "payments": 0, "notes": 0, "amount": 0}
+
+# CONSOLE OUTPUT
+# stdout masuk ke /var/log/billacceptor.log (systemd), jadi hanya pesan >= CONSOLE_LEVEL yang dicetak.
+# Pesan berulang (pulsa, polling) digabung: paling banyak satu baris per interval.
+CONSOLE_IS_TTY = sys.stdout.isatty()
+CONSOLE_PROGRESS_INTERVAL = 60
+console_progress_state = {}
+
+def console_enabled(level):
+    return CONSOLE_LEVELS[level] >= CONSOLE_LEVELS[config.CONSOLE_LEVEL]
+
+def console(message, level="info"):
+    """Mencetak pesan ke console jika levelnya cukup."""
+    if not console_enabled(level):
+        return
+    with print_lock:
+        print(message)
+
+def console_progress(key, message, level="debug", interval=CONSOLE_PROGRESS_INTERVAL):
+    """Mencetak pesan berulang paling banyak sekali per interval; pesan yang dilewati dihitung."""
+    if not console_enabled(level):
+        return
+    now = time.monotonic()
+    last, suppressed = console_progress_state.get(key, (0, 0))
+    if now - last < interval:
+        console_progress_state[key] = (last, suppressed + 1)
+        return
+    console_progress_state[key] = (now, 0)
+    with print_lock:
+        print(f"{message} (+{suppressed} serupa)" if suppressed else message)
+
+def console_countdown(remaining_time):
+    """Countdown timeout hanya ditampilkan di terminal interaktif, tidak pernah ke file log."""
+    if not CONSOLE_IS_TTY or not console_enabled("info"):
+        return
+    with print_lock:
+        print(f"\r Timeout dalam {remaining_time} detik...", end="", flush=True)
 
 # SYSTEM LOGGING
-def log_system(message):
+def log_system(message, level="info", progress_key=None):
     timestamp = datetime.datetime.now().strftime("[%Y-%m-%d %H:%M:%S]")
     with log_lock:
         with open(LOG_FILE, "a") as log:
             log.write(f"{timestamp} {message}\n")
             
-    with print_lock:
-        print(f"{timestamp} {message}")
+    if progress_key:
+        console_progress(progress_key, f"{timestamp} {message}", level)
+    else:
+        console(f"{timestamp} {message}", level)
 
 # TRANSACTION LOGGING
-def log_trans(message):
+def log_trans(message, level="info"):
     timestamp = datetime.datetime.now().strftime("[%Y-%m-%d %H:%M:%S]")
     with log_lock:
         with open(LOG_TRANS, "a") as log:
             log.write(f"{timestamp} {message}\n")
+    if TELEMETRY_URL:
+        telemetry_records.append({"time": timestamp.strip("[]"), "message": message.strip()})
             
-    with print_lock:
-        print(f"{timestamp} {message}")
+    console(f"{timestamp} {message}", level)
+
+# TRANSACTION SNAPSHOT (MMAP)
+# Dua slot berukuran tetap, ditulis bergantian. Slot dengan seq terbesar dan CRC valid dipakai saat startup.
+SNAPSHOT_MAGIC = b"BAS2"
+SNAPSHOT_ID_SIZE = 256
+SNAPSHOT_TOKEN_SIZE = 1024
+SNAPSHOT_RECORD = struct.Struct(f"<4sQB{SNAPSHOT_ID_SIZE}s{SNAPSHOT_TOKEN_SIZE}sqqIId")
+SNAPSHOT_SLOT_SIZE = SNAPSHOT_RECORD.size + 4
+snapshot_seq = 0
+
+def open_snapshot():
+    """Membuka (atau membuat) file snapshot transaksi dan memetakannya ke memori."""
+    size = SNAPSHOT_SLOT_SIZE * 2
+    fd = os.open(SNAPSHOT_FILE, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if os.fstat(fd).st_size != size:
+            os.ftruncate(fd, size)
+        return mmap.mmap(fd, size)
+    finally:
+        os.close(fd)
+
+snapshot_map = open_snapshot()
+
+def snapshot_fits():
+    """True jika ID dan token transaksi saat ini muat di record snapshot."""
+    return len(json.dumps(id_trx).encode()) <= SNAPSHOT_ID_SIZE and len((payment_token or "").encode()) <= SNAPSHOT_TOKEN_SIZE
+
+def write_snapshot(active, flush=False):
+    """Menulis state transaksi saat ini ke slot snapshot berikutnya (in-place, tanpa fsync log)."""
+    global snapshot_seq
+
+    id_raw = json.dumps(id_trx).encode()
+    token_raw = (payment_token or "").encode()
+    if not snapshot_fits():
+        # Tidak muat (sudah dicatat di trigger_transaction): record tidak aktif agar transaksi sebelumnya tidak di-resume
+        active, id_raw, token_raw = False, b"null", b""
+
+    with snapshot_lock:
+        snapshot_seq += 1
+        record = SNAPSHOT_RECORD.pack(
+            SNAPSHOT_MAGIC, snapshot_seq, 1 if active else 0,
+            id_raw, token_raw, product_price, total_inserted,
+            pending_pulse_count, insufficient_payment_count,
+            last_pulse_received_time + config.TIMEOUT,
+        )
+        offset = (snapshot_seq % 2) * SNAPSHOT_SLOT_SIZE
+        snapshot_map[offset:offset + SNAPSHOT_SLOT_SIZE] = record + struct.pack("<I", zlib.crc32(record))
+        if flush:
+            snapshot_map.flush()
+
+def save_snapshot(flush=False):
+    """Menyimpan transaksi yang sedang berjalan ke snapshot."""
+    write_snapshot(True, flush)
+
+def clear_snapshot():
+    """Menandai snapshot sebagai tidak aktif (tidak ada transaksi berjalan)."""
+    write_snapshot(False, flush=True)
+
+def load_snapshot():
+    """Membaca slot snapshot terbaru yang valid. Mengembalikan dict atau None."""
+    global snapshot_seq
+
+    latest = None
+    for slot in range(2):
+        offset = slot * SNAPSHOT_SLOT_SIZE
+        raw = snapshot_map[offset:offset + SNAPSHOT_SLOT_SIZE]
+        record, (crc,) = raw[:SNAPSHOT_RECORD.size], struct.unpack("<I", raw[SNAPSHOT_RECORD.size:])
+        if zlib.crc32(record) != crc:
+            continue
+        magic, seq, active, id_raw, token_raw, price, inserted, pending, insufficient, deadline = SNAPSHOT_RECORD.unpack(record)
+        if magic != SNAPSHOT_MAGIC or (latest and latest["seq"] >= seq):
+            continue
+        latest = {
+            "seq": seq,
+            "active": bool(active),
+            "id_trx": json.loads(id_raw.rstrip(b"\0")),
+            "payment_token": token_raw.rstrip(b"\0").decode() or None,
+            "product_price": price,
+            "total_inserted": inserted,
+            "pending_pulse_count": pending,
+            "insufficient_payment_count": insufficient,
+            "deadline": deadline,
+        }
+
+    if latest:
+        snapshot_seq = latest["seq"]
+    return latest
+
+# PULSE TRACE RECORDER
+# Format per hari: YYYYMMDD.ticks (uint32 tick pigpio mentah) dan YYYYMMDD.idx (satu record per lembar uang).
+# Dianalisis offline dengan pulse_analyzer.py.
+PULSE_TRACE_INDEX = struct.Struct("<dQIHHI")
+trace_ticks = array.array("I")
+trace_lock = threading.Lock()
+
+def record_pulse_tick(tick):
+    """Mencatat tick setiap edge (sebelum debounce) untuk lembar uang yang sedang dibaca."""
+    if PULSE_TRACE:
+        with trace_lock:
+            trace_ticks.append(tick)
+
+def flush_pulse_trace(accepted, decoded, amount):
+    """Menyimpan tick lembar uang yang selesai dibaca ke file trace."""
+    global trace_ticks
+
+    if not PULSE_TRACE:
+        return
+
+    # Callback pigpio menambah tick dari thread lain: ambil dan ganti array di bawah lock yang sama
+    with trace_lock:
+        ticks, trace_ticks = trace_ticks, array.array("I")
+    if not ticks:
+        return
+    base = os.path.join(PULSE_TRACE_DIR, datetime.date.today().strftime("%Y%m%d"))
+    try:
+        with open(base + ".ticks", "ab") as f:
+            f.seek(0, os.SEEK_END)
+            offset = f.tell() // ticks.itemsize
+            ticks.tofile(f)
+        with open(base + ".idx", "ab") as f:
+            f.write(PULSE_TRACE_INDEX.pack(time.time(), offset, len(ticks), min(accepted, 0xFFFF), decoded or 0, amount))
+    except OSError as e:
+        log_system(f" Gagal menulis pulse trace: {e}", "warning")
 
 # PIGPIO INITIALIZATION
 pi = pigpio.pi()
 if not pi.connected:
-    log_system("Gagal terhubung ke pigpio daemon!")
+    log_system("Gagal terhubung ke pigpio daemon!", "error")
     exit()
 
 pi.set_mode(BILL_ACCEPTOR_PIN, pigpio.INPUT)
@@ -101,7 +375,7 @@ pi.write(EN_PIN, 0)
 # FUNCTION TO FETCH INVOICE DETAILS
 def fetch_invoice_details():
     try:
-        response = requests.get(INVOICE_API, timeout=5)
+        response = requests.get(config.INVOICE_API, timeout=5)
         response_data = response.json()
 
         if response.status_code == 200 and "data" in response_data:
@@ -113,7 +387,7 @@ def fetch_invoice_details():
 
         log_system(" Tidak ada invoice yang belum dibayar.")
     except requests.exceptions.RequestException as e:
-        log_system(f" Gagal mengambil data invoice: {e}")
+        log_system(f" Gagal mengambil data invoice: {e}", "warning")
 
     return None, None, None
 
@@ -122,7 +396,7 @@ def send_transaction_status():
     global total_inserted, transaction_active, last_pulse_received_time, insufficient_payment_count
 
     try:
-        response = requests.post(BILL_API, json={
+        response = requests.post(config.BILL_API, json={
             "ID": id_trx,
             "paymentToken": payment_token,
             "productPrice": total_inserted
@@ -132,6 +406,7 @@ def send_transaction_status():
             res_data = response.json()
             log_system(f" Pembayaran sukses: {res_data.get('message')}, Waktu: {res_data.get('payment date')}")
             log_trans(f" Pembayaran sukses: {res_data.get('message')}, Waktu: {res_data.get('payment date')}")
+            telemetry_metrics["payments"] += 1
             reset_transaction()
 
         elif response.status_code == 400:
@@ -141,31 +416,32 @@ def send_transaction_status():
             except ValueError:
                 error_message = response.text
 
-            log_system(f" Gagal ({response.status_code}): {error_message}")
+            log_system(f" Gagal ({response.status_code}): {error_message}", "warning")
 
             if "Insufficient payment" in error_message:
                 insufficient_payment_count += 1
-                log_system(f" Uang kurang, percobaan {insufficient_payment_count}/{MAX_RETRY}")
-                log_trans(f" Uang kurang, percobaan {insufficient_payment_count}/{MAX_RETRY}")
+                log_system(f" Uang kurang, percobaan {insufficient_payment_count}/{config.MAX_RETRY}")
+                log_trans(f" Uang kurang, percobaan {insufficient_payment_count}/{config.MAX_RETRY}")
 
-                if insufficient_payment_count >= MAX_RETRY:
+                if insufficient_payment_count >= config.MAX_RETRY:
                     log_system(" Pembayaran kurang melebihi batas! Transaksi dibatalkan.")
                     log_trans(" Pembayaran kurang melebihi batas! Transaksi dibatalkan.")
                     transaction_active = False  
                     pi.write(EN_PIN, 0)  
-                    log_system(" EN PIN MATI")
+                    log_system(" EN PIN MATI", "debug")
                     reset_transaction()  
                 else:
-                    log_system(f" Pembayaran kurang, percobaan {insufficient_payment_count}/{MAX_RETRY}. Silakan lanjutkan memasukkan uang...")
-                    log_trans(f" Pembayaran kurang, percobaan {insufficient_payment_count}/{MAX_RETRY}. Silakan lanjutkan memasukkan uang...")
+                    log_system(f" Pembayaran kurang, percobaan {insufficient_payment_count}/{config.MAX_RETRY}. Silakan lanjutkan memasukkan uang...")
+                    log_trans(f" Pembayaran kurang, percobaan {insufficient_payment_count}/{config.MAX_RETRY}. Silakan lanjutkan memasukkan uang...")
 
                     # Pastikan transaction_active tetap berjalan
                     transaction_active = True
                     pi.write(EN_PIN, 1)  # Bill acceptor tetap aktif
-                    log_system(f"EN Diaktifkan (inssufficient)")
+                    log_system(f"EN Diaktifkan (inssufficient)", "debug")
                     
                     # Pastikan waktu timeout diperbarui agar tidak langsung reset
                     last_pulse_received_time = time.time()
+                    save_snapshot(flush=True)
 
                     # Jika belum mencapai retry maksimal, timer harus tetap berjalan
                     threading.Thread(target=start_timeout_timer, daemon=True).start()
@@ -181,17 +457,80 @@ def send_transaction_status():
             log_system(f" Respon tidak terduga: {response.status_code}")
 
     except requests.exceptions.RequestException as e:
-        log_system(f" Gagal mengirim status transaksi: {e}")
+        log_system(f" Gagal mengirim status transaksi: {e}", "error")
+
+
+# DENOMINATION PROFILES
+def compile_profile(profile):
+    """Mengompilasi profil nominal menjadi tabel lookup: jumlah pulsa -> (pulsa valid, nominal, confidence)."""
+    tolerance = int(profile.get("tolerance", TOLERANCE))
+    pulses = {int(k): int(v) for k, v in profile["pulses"].items()}
+    exact = {int(p) for p in profile.get("exact", [])}
+    overrides = {int(k): int(v) for k, v in profile.get("overrides", {}).items()}
+
+    if tolerance < 0 or not pulses or min(pulses) < 1 or min(pulses.values()) < 1:
+        raise ValueError("tolerance/pulses tidak valid")
+    for target in overrides.values():
+        if target not in pulses:
+            raise ValueError(f"override ke {target} pulsa tidak ada di pulses")
+
+    candidates = sorted(p for p in pulses if p not in exact)
+    size = max(max(pulses), max(overrides, default=0)) + tolerance + 1
+    table = [None] * size
+    for count in range(1, size):
+        if count in overrides:
+            valid = overrides[count]
+        elif count in pulses:
+            valid = count
+        elif candidates:
+            valid = min(candidates, key=lambda p: abs(p - count))
+            if abs(valid - count) > tolerance:
+                continue
+        else:
+            continue
+        confidence = round(1 - abs(valid - count) / (tolerance + 1), 2)
+        table[count] = (valid, pulses[valid], confidence)
+    return tuple(table)
+
+def read_denomination_profile(name, path):
+    """Membaca dan mengompilasi profil `name` dari file profil. Raise ValueError jika profil tidak bisa dipakai."""
+    try:
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                profile = json.load(f)[name]
+        elif name == "default":
+            profile = DEFAULT_PROFILE
+        else:
+            raise FileNotFoundError(path)
+        return compile_profile(profile)
+    except (OSError, KeyError, ValueError, TypeError, AttributeError) as e:
+        raise ValueError(f"profil nominal '{name}': {e!r}")
+
+def load_denomination_profile(name=None):
+    """Memuat profil dari DENOM_PROFILE_FILE lalu mengganti tabel decode secara atomik. Mengembalikan True jika berhasil."""
+    global decode_table, denom_profile_name
+
+    name = name or config.DENOM_PROFILE
+    try:
+        table = read_denomination_profile(name, config.DENOM_PROFILE_FILE)
+    except ValueError as e:
+        log_system(f" Gagal memuat {e}", "error")
+        return False
 
+    decode_table = table
+    denom_profile_name = name
+    log_system(f" Profil nominal '{name}' dimuat ({sum(1 for entry in table if entry)} jumlah pulsa dikenali).")
+    return True
 
-def closest_valid_pulse(pulses):
-    """Mendapatkan jumlah pulsa yang paling mendekati nilai yang valid."""
-    if pulses == 1:
-        return 1
-    if 2 < pulses < 5:
-        return 2
-    closest_pulse = min(PULSE_MAPPING.keys(), key=lambda x: abs(x - pulses) if x != 1 else float("inf"))
-    return closest_pulse if abs(closest_pulse - pulses) <= TOLERANCE else None
+def decode_pulses(pulses):
+    """Mengubah jumlah pulsa menjadi (pulsa valid, nominal, confidence), atau None jika di luar toleransi."""
+    table = decode_table
+    return table[pulses] if pulses < len(table) else None
+
+# Tanpa tabel decode setiap lembar ditolak (uang masuk tanpa dikreditkan), jadi layanan tidak boleh berjalan
+if not load_denomination_profile():
+    log_system(f" Profil nominal tidak bisa dimuat ({config.DENOM_PROFILE_FILE}), layanan dihentikan.", "error")
+    exit(1)
 
 # FUNCTION TO COUNT PULSES
 def count_pulse(gpio, level, tick):
@@ -202,16 +541,17 @@ def count_pulse(gpio, level, tick):
         return
 
     current_time = time.time()
+    record_pulse_tick(tick)
 
     # DEBOUNCE LOGIC
-    if (current_time - last_pulse_time) > DEBOUNCE_TIME:
+    if (current_time - last_pulse_time) > config.DEBOUNCE_TIME:
         if pending_pulse_count == 0:
             pi.write(EN_PIN, 0)
         pending_pulse_count += 1
         last_pulse_time = current_time
         last_pulse_received_time = current_time 
-        with print_lock:
-            print(f" Pulsa diterima: {pending_pulse_count}")  
+        save_snapshot()
+        console_progress("pulse", f" Pulsa diterima: {pending_pulse_count}", interval=1)
         if timeout_thread is None or not timeout_thread.is_alive():
             timeout_thread = threading.Thread(target=start_timeout_timer, daemon=True)
             timeout_thread.start()
@@ -223,14 +563,14 @@ def start_timeout_timer():
     with transaction_lock: 
         while transaction_active:
             current_time = time.time()
-            remaining_time = max(0, int(TIMEOUT - (current_time - last_pulse_received_time))) 
-            if (current_time - last_pulse_received_time) >= 2 and pending_pulse_count > 0:
+            remaining_time = max(0, int(config.TIMEOUT - (current_time - last_pulse_received_time))) 
+            if (current_time - last_pulse_received_time) >= config.NOTE_GAP and pending_pulse_count > 0:
                     process_final_pulse_count()
                     continue
-            if (current_time - last_pulse_received_time) >= 2 and total_inserted >= product_price:
+            if (current_time - last_pulse_received_time) >= config.NOTE_GAP and total_inserted >= product_price:
                     transaction_active = False
                     pi.write(EN_PIN, 0) 
-                    log_system(" EN PIN MATI") 
+                    log_system(" EN PIN MATI", "debug") 
 
                     overpaid = max(0, total_inserted - product_price) 
 
@@ -247,7 +587,7 @@ def start_timeout_timer():
             if remaining_time == 0:
                     transaction_active = False
                     pi.write(EN_PIN, 0) 
-                    log_system(" EN PIN MATI")
+                    log_system(" EN PIN MATI", "debug")
 
                     remaining_due = max(0, product_price - total_inserted)
                     overpaid = max(0, total_inserted - product_price) 
@@ -266,36 +606,41 @@ def start_timeout_timer():
                     transaction_active = False
                     trigger_transaction()
                     break
-            with print_lock:    
-                print(f"\r Timeout dalam {remaining_time} detik...", end="")
+            console_countdown(remaining_time)
             time.sleep(1)
 
-def process_final_pulse_count():
-    """Memproses pulsa yang terkumpul setelah tidak ada pulsa masuk selama 2 detik."""
-    global pending_pulse_count, total_inserted, pulse_count
+def process_final_pulse_count(enable_acceptor=True):
+    """Memproses pulsa yang terkumpul setelah tidak ada pulsa masuk selama NOTE_GAP detik."""
+    global pending_pulse_count, total_inserted, pulse_count, misread_count
 
     if pending_pulse_count == 0:
         return
 
     # PULSE CORRECTION LOGIC
-    corrected_pulses = closest_valid_pulse(pending_pulse_count)
+    corrected_pulses, received_amount, confidence = decode_pulses(pending_pulse_count) or (0, 0, 0)
+    flush_pulse_trace(pending_pulse_count, corrected_pulses, received_amount)
 
     if corrected_pulses:
-        received_amount = PULSE_MAPPING.get(corrected_pulses, 0)
         total_inserted += received_amount
+        telemetry_metrics["notes"] += 1
+        telemetry_metrics["amount"] += received_amount
         remaining_due = max(product_price - total_inserted, 0)
 
-        log_system(f" Koreksi pulsa: {pending_pulse_count} -> {corrected_pulses} ({received_amount}) | Total: Rp.{total_inserted} | Sisa: Rp.{remaining_due}")
-        log_trans(f" Koreksi pulsa: {pending_pulse_count} -> {corrected_pulses} ({received_amount}) | Total: Rp.{total_inserted} | Sisa: Rp.{remaining_due}")
+        log_system(f" Koreksi pulsa: {pending_pulse_count} -> {corrected_pulses} ({received_amount}, {confidence:.0%}) | Total: Rp.{total_inserted} | Sisa: Rp.{remaining_due}")
+        log_trans(f" Koreksi pulsa: {pending_pulse_count} -> {corrected_pulses} ({received_amount}, {confidence:.0%}) | Total: Rp.{total_inserted} | Sisa: Rp.{remaining_due}")
     
     else:
-        log_system(f" Pulsa {pending_pulse_count} tidak valid!")
+        misread_count += 1
+        log_system(f" Pulsa {pending_pulse_count} tidak valid! (profil: {denom_profile_name}, misread ke-{misread_count})")
+        log_trans(f" Misread: {pending_pulse_count} pulsa di luar toleransi profil {denom_profile_name}")
 
     pending_pulse_count = 0 
+    save_snapshot(flush=True)
+    if not enable_acceptor:
+        return
     pi.write(EN_PIN, 1)
-    log_system(f"EN Diaktifkan (Correction)")
-    with print_lock:
-        print(" Koreksi selesai, EN_PIN diaktifkan kembali")
+    log_system(f"EN Diaktifkan (Correction)", "debug")
+    console(" Koreksi selesai, EN_PIN diaktifkan kembali", "debug")
 
 # RESET TRANSACTION FUNCTION
 def reset_transaction():
@@ -308,12 +653,13 @@ def reset_transaction():
     last_pulse_received_time = time.time()  
     insufficient_payment_count = 0  
     pending_pulse_count = 0  
+    clear_snapshot()
     log_system(" Transaksi di-reset ke default.")
 
 # API ENDPOINTS FOR MONITORING SYSTEM STATS
-@app.route('/api/system_stats', methods=['GET'])
-def get_system_stats():
-    cpu_percent = psutil.cpu_percent(interval=1)
+def collect_system_stats(cpu_interval=1):
+    """Mengumpulkan statistik sistem (CPU, RAM, disk, suhu, uptime)."""
+    cpu_percent = psutil.cpu_percent(interval=cpu_interval)
     
     mem = psutil.virtual_memory()
     ram_percent = mem.percent
@@ -341,7 +687,7 @@ def get_system_stats():
     else:
         uptime_pi = f"{uptime_hours}h {uptime_minutes}m {uptime_seconds}s"
     
-    return jsonify({
+    return {
         "cpu": cpu_percent,
         "ram": {
             "percent": ram_percent,
@@ -355,7 +701,11 @@ def get_system_stats():
         },
         "temperature": temperature,
         "uptime": uptime_pi
-    })
+    }
+
+@app.route('/api/system_stats', methods=['GET'])
+def get_system_stats():
+    return jsonify(collect_system_stats())
 
 #API ENDPOINTS FOR PAYMENT LOGS
 @app.route('/api/payment_logs', methods=['GET'])
@@ -374,6 +724,193 @@ def get_payment_logs():
             "message": f"Gagal membaca log: {e}"
         }), 500
 
+# CONFIG RELOAD
+config_lock = threading.Lock()
+
+def mask_config_value(key, value):
+    return "***" if key in SECRET_FIELDS and value else value
+
+def request_config_reload():
+    """Memuat ulang dan memvalidasi konfigurasi, lalu menjadwalkannya untuk dipasang di antara transaksi.
+
+    Mengembalikan (perubahan, perubahan yang butuh restart). Raise ValueError jika konfigurasi tidak valid.
+    """
+    global pending_config, pending_profile
+
+    try:
+        new_config = load_config()
+        # Isi DENOM_PROFILE_FILE ikut dimuat ulang; profil yang dipilih lewat API tetap dipakai kecuali DENOM_PROFILE diubah
+        profile_name = new_config.DENOM_PROFILE if new_config.DENOM_PROFILE != config.DENOM_PROFILE else denom_profile_name
+        profile_table = read_denomination_profile(profile_name, new_config.DENOM_PROFILE_FILE)
+    except ValueError as e:
+        log_system(f" Reload konfigurasi ditolak: {e}", "warning")
+        raise
+
+    with config_lock:
+        current = config
+        changes, restart_required = {}, {}
+        for key, (_, _, reloadable) in CONFIG_FIELDS.items():
+            old, new = getattr(current, key), getattr(new_config, key)
+            if old != new:
+                target = changes if reloadable else restart_required
+                target[key] = [mask_config_value(key, old), mask_config_value(key, new)]
+
+        # Field yang hanya dibaca saat startup tetap memakai nilai lama
+        pending_config = new_config._replace(**{key: getattr(current, key) for key in restart_required})
+        pending_profile = (profile_name, profile_table)
+
+    log_system(f" Konfigurasi baru divalidasi, perubahan: {changes or 'tidak ada'}")
+    if restart_required:
+        log_system(f" Perubahan berikut butuh restart layanan: {restart_required}")
+    return changes, restart_required
+
+def apply_pending_config():
+    """Memasang konfigurasi baru secara atomik. Hanya dipanggil saat tidak ada transaksi berjalan."""
+    global config, pending_config, pending_profile, decode_table, denom_profile_name
+
+    with config_lock:
+        if pending_config is None:
+            return
+        # Tabel decode sudah dikompilasi saat reload divalidasi, jadi dipasang bersama konfigurasinya
+        config, pending_config = pending_config, None
+        (denom_profile_name, decode_table), pending_profile = pending_profile, None
+
+    log_system(f" Konfigurasi baru dipasang (profil nominal '{denom_profile_name}').")
+
+def request_config_reload_quietly():
+    try:
+        request_config_reload()
+    except ValueError:
+        pass
+
+def handle_sighup(signum, frame):
+    """SIGHUP (systemctl reload billacceptor): reload dijalankan di thread terpisah, bukan di dalam signal handler."""
+    threading.Thread(target=request_config_reload_quietly, daemon=True).start()
+
+def admin_authorized():
+    return bool(config.ADMIN_TOKEN) and request.headers.get("X-Admin-Token") == config.ADMIN_TOKEN
+
+#API ENDPOINTS FOR CONFIGURATION
+@app.route('/api/config', methods=['GET'])
+def get_config():
+    if not admin_authorized():
+        return jsonify({"status": "error", "message": "Tidak diizinkan"}), 403
+    return jsonify({key: mask_config_value(key, value) for key, value in config._asdict().items()})
+
+@app.route('/api/config/reload', methods=['POST'])
+def reload_config():
+    if not admin_authorized():
+        return jsonify({"status": "error", "message": "Tidak diizinkan"}), 403
+
+    try:
+        changes, restart_required = request_config_reload()
+    except ValueError as e:
+        return jsonify({"status": "error", "message": f"Konfigurasi tidak valid: {e}"}), 400
+
+    return jsonify({
+        "status": "success",
+        "changes": changes,
+        "restart_required": restart_required,
+        "applied": "setelah transaksi selesai" if transaction_active else "dalam 1 detik"
+    }), 200
+
+#API ENDPOINTS FOR DENOMINATION PROFILE
+@app.route('/api/denomination_profile', methods=['GET'])
+def get_denomination_profile():
+    return jsonify({
+        "profile": denom_profile_name,
+        "misread": misread_count,
+        "table": {count: {"pulses": entry[0], "amount": entry[1], "confidence": entry[2]} for count, entry in enumerate(decode_table) if entry}
+    })
+
+@app.route('/api/denomination_profile', methods=['POST'])
+def set_denomination_profile():
+    if not admin_authorized():
+        return jsonify({"status": "error", "message": "Tidak diizinkan"}), 403
+
+    data = request.get_json(silent=True)
+    if data is None:
+        data = {}
+    if not isinstance(data, dict):
+        return jsonify({"status": "error", "message": "Body harus berupa objek JSON"}), 400
+
+    name = data.get("profile", denom_profile_name)
+    if not load_denomination_profile(name):
+        return jsonify({"status": "error", "message": f"Gagal memuat profil '{name}'"}), 400
+    return jsonify({"status": "success", "profile": denom_profile_name}), 200
+
+# TELEMETRY UPLINK
+def spool_telemetry(body):
+    """Menyimpan batch yang gagal dikirim ke disk, membuang yang paling lama jika spool penuh."""
+    try:
+        with open(os.path.join(TELEMETRY_SPOOL_DIR, f"{time.time_ns()}.json.gz"), "wb") as f:
+            f.write(body)
+        spooled = sorted(os.listdir(TELEMETRY_SPOOL_DIR))
+        for name in spooled[:-1000]:
+            os.remove(os.path.join(TELEMETRY_SPOOL_DIR, name))
+    except OSError as e:
+        log_system(f" Gagal menyimpan spool telemetry: {e}", "warning")
+
+def post_telemetry(body):
+    """Mengirim satu batch terkompresi ke collector. Mengembalikan True jika batch selesai (diterima atau ditolak permanen)."""
+    headers = {"Content-Type": "application/json", "Content-Encoding": "gzip"}
+    if config.TELEMETRY_TOKEN:
+        headers["X-Telemetry-Token"] = config.TELEMETRY_TOKEN
+    try:
+        response = requests.post(TELEMETRY_URL, data=body, headers=headers, timeout=10)
+        if 400 <= response.status_code < 500 and response.status_code not in (401, 403, 429):
+            # Batch yang tidak akan pernah diterima dibuang agar tidak memblokir antrean spool
+            log_system(f" Batch telemetry ditolak collector ({response.status_code}), dibuang.", "warning", progress_key="telemetry_rejected")
+            return True
+        return 200 <= response.status_code < 300
+    except requests.exceptions.RequestException:
+        return False
+
+def flush_telemetry_spool(limit=10):
+    """Mengirim batch tertunda, paling lama dulu. Mengembalikan True jika spool sudah kosong."""
+    try:
+        spooled = sorted(os.listdir(TELEMETRY_SPOOL_DIR))
+        for name in spooled[:limit]:
+            path = os.path.join(TELEMETRY_SPOOL_DIR, name)
+            with open(path, "rb") as f:
+                if not post_telemetry(f.read()):
+                    return False
+            os.remove(path)
+        return len(spooled) <= limit
+    except OSError as e:
+        log_system(f" Gagal mengirim spool telemetry: {e}", "warning")
+        return False
+
+def telemetry_uplink():
+    """Setiap TELEMETRY_INTERVAL detik mengirim log transaksi, metrik, dan statistik sistem dalam satu request."""
+    while True:
+        time.sleep(config.TELEMETRY_INTERVAL)
+
+        records = []
+        while telemetry_records:
+            records.append(telemetry_records.popleft())
+
+        batch = {
+            "device": ID_DEVICE,
+            "sent_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "transactions": records,
+            "metrics": {
+                **telemetry_metrics,
+                "misread": misread_count,
+                "profile": denom_profile_name,
+                "transaction_active": transaction_active,
+                "total_inserted": total_inserted,
+                "product_price": product_price,
+            },
+            "stats": collect_system_stats(cpu_interval=None),
+        }
+        body = gzip.compress(json.dumps(batch).encode())
+
+        # Batch tertunda dikirim lebih dulu agar collector menerima data sesuai urutan waktu;
+        # selama spool belum kosong, batch baru diantrekan di belakangnya
+        if not flush_telemetry_spool() or not post_telemetry(body):
+            spool_telemetry(body)
+
 #FUNCTION TO TRIGGER A NEW TRANSACTION
 def trigger_transaction():
     global transaction_active, total_inserted, id_trx, payment_token, product_price, last_pulse_received_time, pending_pulse_count
@@ -383,10 +920,13 @@ def trigger_transaction():
             time.sleep(1) 
             continue
 
-        print(" Mencari payment token terbaru...")
+        # Konfigurasi baru hanya dipasang di antara transaksi
+        apply_pending_config()
+
+        console_progress("token_poll", " Mencari payment token terbaru...", "info")
         
         try:
-            response = requests.get(TOKEN_API, timeout=1)
+            response = requests.get(config.TOKEN_API, timeout=1)
             response_data = response.json()
 
             if response.status_code == 200 and "data" in response_data:
@@ -399,7 +939,7 @@ def trigger_transaction():
                         payment_token = token_data["PaymentToken"]
                         log_system(f" Token ditemukan: {payment_token}, umur: {age_in_minutes:.2f} menit")
 
-                        invoice_response = requests.get(f"{INVOICE_API}{payment_token}", timeout=5)
+                        invoice_response = requests.get(f"{config.INVOICE_API}{payment_token}", timeout=5)
                         invoice_data = invoice_response.json()
 
                         if invoice_response.status_code == 200 and "data" in invoice_data:
@@ -411,23 +951,79 @@ def trigger_transaction():
                                 transaction_active = True
                                 pending_pulse_count = 0 
                                 last_pulse_received_time = time.time()
+                                if not snapshot_fits():
+                                    log_system(" Snapshot tidak aktif untuk transaksi ini: ID/token terlalu panjang.", "warning")
+                                save_snapshot(flush=True)
+                                telemetry_metrics["transactions"] += 1
                                 log_system(f" Transaksi dimulai! ID: {id_trx}, Token: {payment_token}, Tagihan: Rp.{product_price}")
                                 log_trans(f" Transaksi dimulai! ID: {id_trx}, Token: {payment_token}, Tagihan: Rp.{product_price}")
                                 pi.write(EN_PIN, 1)
-                                log_system(f"EN Diaktifkan  (Token)")
+                                log_system(f"EN Diaktifkan  (Token)", "debug")
                                 threading.Thread(target=start_timeout_timer, daemon=True).start()
                                 return
                             else:
                                 log_system(f"⚠ Invoice {payment_token} sudah dibayar, mencari lagi...")
 
-            print(" Tidak ada payment token yang memenuhi syarat. Menunggu...")
+            console_progress("token_empty", " Tidak ada payment token yang memenuhi syarat. Menunggu...", "info")
             time.sleep(1)
 
         except requests.exceptions.RequestException as e:
-            log_system(f" Gagal mengambil daftar payment token: {e}")
+            log_system(f" Gagal mengambil daftar payment token: {e}", "warning", progress_key="token_error")
             time.sleep(1)
 
+#FUNCTION TO RESUME A TRANSACTION FROM THE SNAPSHOT
+def resume_transaction():
+    """Melanjutkan atau mengirim transaksi yang terputus karena layanan mati.
+
+    Mengembalikan True jika transaksi diambil alih (loop transaksi berikutnya dijalankan dari sini).
+    """
+    global transaction_active, total_inserted, id_trx, payment_token, product_price, last_pulse_received_time, pending_pulse_count, insufficient_payment_count
+
+    snapshot = load_snapshot()
+    if not snapshot or not snapshot["active"]:
+        return False
+
+    id_trx = snapshot["id_trx"]
+    payment_token = snapshot["payment_token"]
+    product_price = snapshot["product_price"]
+    total_inserted = snapshot["total_inserted"]
+    pending_pulse_count = snapshot["pending_pulse_count"]
+    insufficient_payment_count = snapshot["insufficient_payment_count"]
+    last_pulse_received_time = snapshot["deadline"] - config.TIMEOUT
+    log_system(f" Snapshot ditemukan! ID: {id_trx}, Token: {payment_token}, Tagihan: Rp.{product_price}, Masuk: Rp.{total_inserted}, Pulsa tertunda: {pending_pulse_count}")
+    log_trans(f" Snapshot ditemukan! ID: {id_trx}, Token: {payment_token}, Tagihan: Rp.{product_price}, Masuk: Rp.{total_inserted}")
+
+    if time.time() < snapshot["deadline"]:
+        process_final_pulse_count()
+        transaction_active = True
+        pi.write(EN_PIN, 1)
+        log_system(f"EN Diaktifkan (Resume)", "debug")
+        threading.Thread(target=start_timeout_timer, daemon=True).start()
+        return True
+
+    # Pulsa tertunda tetap dihitung, tetapi bill acceptor tidak diaktifkan lagi
+    process_final_pulse_count(enable_acceptor=False)
+    pi.write(EN_PIN, 0)
+    log_system(" Batas waktu transaksi terlewati saat layanan mati.")
+    threading.Thread(target=submit_resumed_transaction, daemon=True).start()
+    return True
+
+def submit_resumed_transaction():
+    """Mengirim transaksi yang kedaluwarsa di background agar startup tidak menunggu API."""
+    if total_inserted > 0:
+        send_transaction_status()
+    else:
+        reset_transaction()
+
+    # Jika uang kurang dan masih bisa retry, timer transaksi yang melanjutkan
+    if not transaction_active:
+        trigger_transaction()
+
 if __name__ == "__main__":
+    signal.signal(signal.SIGHUP, handle_sighup)
     pi.callback(BILL_ACCEPTOR_PIN, pigpio.RISING_EDGE, count_pulse)
-    threading.Thread(target=trigger_transaction, daemon=True).start()
-    app.run(host="0.0.0.0", port=PORT, debug=False, use_reloader=False)
\ No newline at end of file
+    if not resume_transaction():
+        threading.Thread(target=trigger_transaction, daemon=True).start()
+    if TELEMETRY_URL:
+        threading.Thread(target=telemetry_uplink, daemon=True).start()
+    app.run(host="0.0.0.0", port=PORT, debug=False, use_reloader=False)
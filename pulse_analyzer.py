@@ -0,0 +1,189 @@
+import os
+import glob
+import json
+import argparse
+import numpy as np
+
+# FORMAT TRACE (lihat PULSE TRACE RECORDER di billacceptor.py)
+INDEX_DTYPE = np.dtype([
+    ("time", "<f8"),
+    ("offset", "<u8"),
+    ("count", "<u4"),
+    ("accepted", "<u2"),
+    ("decoded", "<u2"),
+    ("amount", "<u4"),
+])
+TICK_DTYPE = np.dtype("<u4")
+
+# ANALYSIS CONFIGURATION
+BOUNCE_RATIO = 0.5
+DROPOUT_RATIO = 1.5
+GAP_FACTOR = 3
+
+def find_traces(paths):
+    """Mencari semua file .idx dari daftar file/direktori (rekursif, satu folder per device)."""
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            found.extend(glob.glob(os.path.join(path, "**", "*.idx"), recursive=True))
+        elif path.endswith(".idx"):
+            found.append(path)
+    return sorted(found)
+
+def load_traces(paths):
+    """Membaca semua trace per file. Mengembalikan daftar (index, ticks) dengan offset relatif terhadap file-nya."""
+    traces = []
+    for idx_path in find_traces(paths):
+        tick_path = idx_path[:-4] + ".ticks"
+        if not os.path.exists(tick_path):
+            continue
+        idx = np.fromfile(idx_path, dtype=INDEX_DTYPE)
+        ticks = np.fromfile(tick_path, dtype=TICK_DTYPE)
+
+        # Record terakhir bisa terpotong jika layanan mati saat menulis
+        idx = idx[idx["offset"] + idx["count"] <= len(ticks)]
+        if len(idx):
+            traces.append((idx, ticks))
+    return traces
+
+def note_intervals(idx, ticks):
+    """Interval antar edge (mikrodetik) di dalam lembar yang sama beserta nominal lembarnya, aman terhadap wrap tick uint32."""
+    # Lembar milik setiap edge: lembar terakhir yang dimulai di/ sebelum edge tsb, selama edge masih di dalam rentangnya
+    nonempty = np.flatnonzero(idx["count"] > 0)
+    starts = np.zeros(len(ticks), np.int32)
+    starts[idx["offset"][nonempty]] = nonempty + 1
+    note = np.maximum.accumulate(starts) - 1
+    ends = (idx["offset"] + idx["count"]).astype(np.int64)
+    inside = (note >= 0) & (np.arange(len(ticks)) < ends[note])
+
+    intervals = np.diff(ticks)
+    same_note = inside[1:] & inside[:-1] & (note[1:] == note[:-1])
+    return intervals[same_note], idx["amount"][note[1:][same_note]]
+
+def recount(idx, ticks, debounce_us):
+    """Menghitung ulang jumlah pulsa per lembar dengan nilai debounce tertentu.
+
+    Sama seperti count_pulse: edge diterima jika jaraknya dari edge terakhir yang DITERIMA
+    (bukan edge mentah sebelumnya) lebih dari debounce. Edge pertama setiap lembar selalu diterima.
+    Semua lembar dilangkahi bersamaan, satu langkah per pulsa yang diterima; searchsorted hanya dipakai
+    jika edge berikutnya adalah bounce.
+    """
+    elapsed = np.zeros(len(ticks), np.int64)
+    np.cumsum(np.diff(ticks), dtype=np.int64, out=elapsed[1:])
+
+    notes = np.flatnonzero(idx["count"] > 0)
+    counts = np.zeros(len(idx), np.int64)
+    counts[notes] = 1
+    position = idx["offset"][notes].astype(np.int64)
+    end = position + idx["count"][notes]
+    last = len(ticks) - 1
+    while len(notes):
+        threshold = elapsed[position] + debounce_us
+        position = position + 1
+        bounce = (position < end) & (elapsed[np.minimum(position, last)] <= threshold)
+        position[bounce] = np.searchsorted(elapsed, threshold[bounce], side="right")
+        inside = position < end
+        notes, position, end = notes[inside], position[inside], end[inside]
+        counts[notes] += 1
+    return counts
+
+def percentile(values, q, default=0.0):
+    return float(np.percentile(values, q)) if len(values) else default
+
+def analyze(traces, debounce_ms):
+    """Menghitung distribusi interval per nominal, rasio bounce/dropout, dan rekomendasi parameter."""
+    index = np.concatenate([idx for idx, _ in traces])
+    parts = [note_intervals(idx, ticks) for idx, ticks in traces]
+    intervals = np.concatenate([part[0] for part in parts])
+    interval_amount = np.concatenate([part[1] for part in parts])
+
+    report = {"notes": int(len(index)), "misread": int((index["decoded"] == 0).sum()), "denominations": {}}
+
+    # Periode pulsa nominal diambil dari seluruh interval (didominasi pulsa asli, bukan bounce)
+    period = percentile(intervals, 50)
+    bounce_mask = intervals < period * BOUNCE_RATIO
+    dropout_mask = intervals > period * DROPOUT_RATIO
+
+    for amount in np.unique(index["amount"][index["decoded"] > 0]):
+        selected = interval_amount == amount
+        values = intervals[selected & ~bounce_mask]
+        bounces = bounce_mask[selected]
+        dropouts = dropout_mask[selected]
+        notes = index[index["amount"] == amount]
+
+        report["denominations"][int(amount)] = {
+            "pulses": int(notes["decoded"][0]),
+            "notes": int(len(notes)),
+            "interval_ms": dict(zip(("p1", "p50", "p99"), (np.percentile(values, [1, 50, 99]) / 1000).tolist() if len(values) else (0.0, 0.0, 0.0))),
+            "bounce_rate": float(bounces.mean()) if len(bounces) else 0.0,
+            "dropout_rate": float(dropouts.mean()) if len(dropouts) else 0.0,
+            "undercount_rate": float((notes["accepted"] < notes["decoded"]).mean()),
+            "overcount_rate": float((notes["accepted"] > notes["decoded"]).mean()),
+        }
+
+    # DEBOUNCE: di tengah celah antara klaster bounce dan klaster pulsa asli
+    pulse_low = percentile(intervals[~bounce_mask], 0.5)
+    if bounce_mask.any():
+        debounce_us = (percentile(intervals[bounce_mask], 99) + pulse_low) / 2
+    else:
+        debounce_us = pulse_low / 2
+
+    # GAP: cukup panjang agar jeda terpanjang di dalam satu lembar tidak memotong lembar
+    gap_s = np.ceil(percentile(intervals[~bounce_mask], 99.9) * GAP_FACTOR / 1e5) / 10
+
+    # TOLERANCE: selisih hitungan ulang terhadap jumlah pulsa valid terdekat
+    valid = np.unique(index["decoded"][index["decoded"] > 0])
+    counts = np.concatenate([recount(idx, ticks, debounce_us) for idx, ticks in traces])
+    tolerance = 0
+    if len(valid):
+        error = np.abs(counts[:, None] - valid[None, :]).min(axis=1)
+        tolerance = int(np.ceil(percentile(error, 99)))
+
+    # Perbandingan: lembar yang hitungannya tidak sama persis dengan jumlah pulsa hasil decode
+    decoded = index["decoded"] > 0
+    current = np.concatenate([recount(idx, ticks, debounce_ms * 1000) for idx, ticks in traces])
+
+    report["current"] = {
+        "DEBOUNCE_TIME": debounce_ms / 1000,
+        "mismatch_rate": float((current[decoded] != index["decoded"][decoded]).mean()) if decoded.any() else 0.0,
+    }
+    report["recommended"] = {
+        "DEBOUNCE_TIME": round(debounce_us / 1e6, 3),
+        "NOTE_GAP": float(gap_s),
+        "TOLERANCE": tolerance,
+        "mismatch_rate": float((counts[decoded] != index["decoded"][decoded]).mean()) if decoded.any() else 0.0,
+    }
+    return report
+
+def print_report(report):
+    print(f"\n📊 Lembar uang: {report['notes']} | Tidak valid: {report['misread']}\n")
+    print(f"{'Nominal':>10} {'Pulsa':>6} {'Lembar':>8} {'p1 ms':>8} {'p50 ms':>8} {'p99 ms':>8} {'Bounce':>8} {'Dropout':>8} {'Kurang':>8} {'Lebih':>8}")
+    for amount, d in sorted(report["denominations"].items()):
+        iv = d["interval_ms"]
+        print(f"{amount:>10} {d['pulses']:>6} {d['notes']:>8} {iv['p1']:>8.1f} {iv['p50']:>8.1f} {iv['p99']:>8.1f} "
+              f"{d['bounce_rate']:>8.2%} {d['dropout_rate']:>8.2%} {d['undercount_rate']:>8.2%} {d['overcount_rate']:>8.2%}")
+
+    current, recommended = report["current"], report["recommended"]
+    print(f"\n⚙️ Saat ini: DEBOUNCE_TIME = {current['DEBOUNCE_TIME']} (hitungan tidak tepat: {current['mismatch_rate']:.2%})")
+    print("🔧 Rekomendasi:")
+    for key in ("DEBOUNCE_TIME", "NOTE_GAP", "TOLERANCE"):
+        print(f"   {key} = {recommended[key]}")
+    print(f"   (hitungan tidak tepat: {recommended['mismatch_rate']:.2%})")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analisis pulse trace bill acceptor")
+    parser.add_argument("paths", nargs="+", help="File .idx atau direktori trace (boleh banyak device)")
+    parser.add_argument("--debounce-ms", type=float, default=50, help="DEBOUNCE_TIME yang sedang dipakai (ms)")
+    parser.add_argument("--json", action="store_true", help="Cetak hasil sebagai JSON")
+    args = parser.parse_args()
+
+    traces = load_traces(args.paths)
+    if not traces:
+        print("❌ Tidak ada trace yang ditemukan.")
+        exit(1)
+
+    report = analyze(traces, args.debounce_ms)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
@@ -1,4 +1,9 @@
 import os
+import sys
+import json
+import shlex
+import hashlib
+import argparse
 import subprocess
 import logging
 
@@ -18,12 +23,79 @@ def print_log(message, level="info"):
         logging.error(message)
 
 def run_command(command):
-    """Menjalankan perintah shell dengan subprocess dan menangani error."""
+    """Menjalankan perintah shell dengan subprocess dan menangani error. Mengembalikan True jika berhasil."""
     try:
         subprocess.run(command, check=True, shell=True)
         print_log(f"Berhasil menjalankan: {command}")
+        return True
     except subprocess.CalledProcessError as e:
         print_log(f"Gagal menjalankan: {command}\nError: {e}", "error")
+        return False
+
+# MANIFEST ROLLBACK
+MANIFEST_FILE = "setup_manifest.json"
+
+def read_manifest(path):
+    """Membaca manifest yang ditulis setup.py. Mengembalikan None jika tidak ada."""
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as file:
+        return json.load(file)
+
+def file_sha256(path):
+    try:
+        with open(path, "rb") as file:
+            return hashlib.sha256(file.read()).hexdigest()
+    except OSError:
+        return None
+
+def plan_rollback(manifest, manifest_path):
+    """Menyusun daftar perintah untuk membatalkan persis artefak yang tercatat di manifest."""
+    commands = []
+    services = manifest.get("services", [])
+    files = manifest.get("files", {})
+    firewall = manifest.get("firewall", {})
+    packages = manifest.get("packages", {})
+
+    for service in services:
+        commands.append(f"sudo systemctl stop {service}")
+        commands.append(f"sudo systemctl disable {service}")
+
+    for path, info in files.items():
+        if os.path.exists(path) and file_sha256(path) != info.get("sha256"):
+            print_log(f"File {path} sudah diubah sejak setup, tetap dihapus.", "warning")
+        commands.append(f"sudo rm -f {shlex.quote(path)}")
+    if any(path.startswith("/etc/systemd/system/") for path in files):
+        commands.append("sudo systemctl daemon-reload")
+
+    # UFW dinonaktifkan dulu agar menghapus rule SSH tidak memutus sesi yang menjalankan rollback
+    if firewall.get("enabled_by_setup"):
+        commands.append("sudo ufw disable")
+    for rule in firewall.get("rules", []):
+        commands.append(f"sudo ufw delete {rule}")
+
+    if packages.get("pip"):
+        commands.append(f"sudo pip3 uninstall -y {' '.join(packages['pip'])} --break-system-packages")
+    if packages.get("apt"):
+        commands.append(f"sudo apt remove --purge -y {' '.join(packages['apt'])}")
+
+    for directory in sorted(manifest.get("directories", []), key=len, reverse=True):
+        commands.append(f"sudo rm -rf {shlex.quote(directory)}")
+
+    commands.append(f"sudo rm -f {shlex.quote(manifest_path)}")
+    return commands
+
+def rollback_from_manifest(manifest, manifest_path, dry_run=False):
+    """Menjalankan (atau hanya menampilkan, jika dry_run) rencana rollback dari manifest."""
+    commands = plan_rollback(manifest, manifest_path)
+    if dry_run:
+        print("\n📋 **Rencana rollback**\n")
+        for command in commands:
+            print(f"  - {command}")
+        return True
+
+    results = [run_command(command) for command in commands]
+    return all(results)
 
 def read_setup_log(log_path):
     """Membaca setup.log untuk mendapatkan informasi konfigurasi."""
@@ -35,15 +107,15 @@ def read_setup_log(log_path):
     with open(log_path, "r") as file:
         for line in file:
             if "Python Path:" in line:
-                config["python_path"] = line.split(":")[1].strip()
+                config["python_path"] = line.split(":", 1)[1].strip()
             elif "LOG_DIR:" in line:
-                config["log_dir"] = line.split(":")[1].strip()
+                config["log_dir"] = line.split(":", 1)[1].strip()
             elif "Flask Port:" in line:
-                config["flask_port"] = line.split(":")[1].strip()
+                config["flask_port"] = line.split(":", 1)[1].strip()
             elif "VPN Log Path:" in line:
-                config["vpn_log"] = line.split(":")[1].strip()
+                config["vpn_log"] = line.split(":", 1)[1].strip()
             elif "ID_DEVICE:" in line:
-                config["id_device"] = line.split(":")[1].strip()
+                config["id_device"] = line.split(":", 1)[1].strip()
     return config
 
 def uninstall_dependencies():
@@ -64,6 +136,7 @@ def remove_files(python_path, log_dir, vpn_log):
 
     files_to_remove = [
         f"{python_path}/billacceptor.py",
+        f"{python_path}/denominations.json",
         "/etc/systemd/system/billacceptor.service",
         "/etc/ppp/peers/vpn",
     ]
@@ -135,20 +208,43 @@ def clone_repository():
         run_command(f"git clone https://github.com/lmugmxpolinema/billacceptor_xpdisi.git {clone_dir}")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rollback Bill Acceptor")
+    parser.add_argument("--manifest", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), MANIFEST_FILE),
+                        help="Path manifest dari setup.py (default: di samping rollback.py)")
+    parser.add_argument("--dry-run", action="store_true", help="Tampilkan rencana rollback tanpa menjalankannya")
+    args = parser.parse_args()
+
     print("\n🔧 **Rollback Bill Acceptor**\n")
-    
-    # Membaca konfigurasi dari setup.log
-    setup_log_path = "setup.log"
-    config = read_setup_log(setup_log_path)
-    
-    # Menjalankan rollback otomatis
-    remove_files(config["python_path"], config["log_dir"], config["vpn_log"])  # ✅ FIX KeyError
-    disable_service()
-    reset_firewall(config["flask_port"])  # ✅ FIX KeyError
-    clear_crontab()
-    clear_rc_local()
-    uninstall_dependencies()
+
+    manifest = read_manifest(args.manifest)
+    if manifest is not None:
+        # Membatalkan persis apa yang tercatat di manifest
+        ok = rollback_from_manifest(manifest, args.manifest, args.dry_run)
+        if args.dry_run:
+            sys.exit(0)
+    else:
+        # Instalasi lama tanpa manifest: rollback berdasarkan setup.log
+        print_log(f"Manifest {args.manifest} tidak ditemukan, memakai setup.log.", "warning")
+        setup_log_path = "setup.log"
+        config = read_setup_log(setup_log_path)
+        if args.dry_run:
+            print_log("Dry-run hanya didukung untuk rollback berbasis manifest.", "warning")
+            sys.exit(0)
+
+        # Menjalankan rollback otomatis
+        remove_files(config["python_path"], config["log_dir"], config.get("vpn_log"))
+        disable_service()
+        reset_firewall(config["flask_port"])
+        clear_crontab()
+        clear_rc_local()
+        uninstall_dependencies()
+        ok = True
+
     # Clone repository jika diinginkan
     clone_repository()
     
-    print("\n🎉 **Rollback selesai! Semua konfigurasi telah dihapus.** 🎉")
\ No newline at end of file
+    if ok:
+        print("\n🎉 **Rollback selesai! Semua konfigurasi telah dihapus.** 🎉")
+    else:
+        print_log("Rollback selesai dengan error, periksa log di atas.", "error")
+        sys.exit(1)
@@ -1,7 +1,17 @@
 import os
 import re
+import sys
+import json
+import time
+import shlex
+import socket
+import hashlib
+import datetime
+import tempfile
+import argparse
 import subprocess
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
 polinema = ("""                              .:x;.                              
                          :;XX; .::..+$x:.                        
@@ -92,92 +102,326 @@ def print_log(message, level="info"):
         logging.error(message)
 
 def run_command(command):
-    """Menjalankan perintah shell dengan subprocess dan menangani error."""
+    """Menjalankan perintah shell dengan subprocess dan menangani error. Mengembalikan True jika berhasil."""
     try:
         subprocess.run(command, check=True, shell=True)
         print_log(f"Berhasil menjalankan: {command}")
+        return True
     except subprocess.CalledProcessError as e:
         print_log(f"Gagal menjalankan: {command}\nError: {e}", "error")
+        return False
 
-def install_dependencies():
-    """Menginstal semua dependensi yang dibutuhkan."""
-    print_log("📦 Menginstal dependensi...")
-    dependencies = [
-        "sudo apt update && sudo apt upgrade -y",
-        "sudo apt install python3-pip -y",
-        "sudo pip3 install flask requests --break-system-packages",
-        "sudo pip3 install psutil flask_cors --break-system-packages",
-        "sudo pip3 install python-dotenv --break-system-packages",
-        "sudo apt install -y ufw",
-        "sudo systemctl start pigpiod",
-        "sudo systemctl enable pigpiod"
-    ]
-    for dep in dependencies:
-        run_command(dep)
-    print_log("✅ Semua dependensi telah terinstal.")
-
-def replace_line_in_file(filename, pattern, replacement):
-    """Mengganti baris dalam file berdasarkan pola tertentu."""
-    if not os.path.exists(filename):
-        print_log(f"❌ File tidak ditemukan: {filename}", "error")
-        return  
+# DEPENDENSI
+APT_PACKAGES = ["python3-pip", "ufw"]
+PIP_PACKAGES = ["flask", "requests", "psutil", "flask_cors", "python-dotenv"]
+
+# MANIFEST
+SOURCE_DIR = os.path.dirname(os.path.abspath(__file__))
+MANIFEST_FILE = "setup_manifest.json"
+SERVICE_NAME = "billacceptor.service"
+SERVICE_PATH = f"/etc/systemd/system/{SERVICE_NAME}"
+FIREWALL_ALLOW = ["22/tcp"]
+
+def check_command(args):
+    """Menjalankan perintah pemeriksaan (read-only) tanpa mencetak output. Mengembalikan CompletedProcess atau None."""
     try:
-        with open(filename, "r") as file:
-            lines = file.readlines()
-        
-        with open(filename, "w") as file:
-            for line in lines:
-                if re.search(pattern, line):
-                    file.write(replacement + "\n")
-                else:
-                    file.write(line)
-        print_log(f"✅ Berhasil mengedit file: {filename}")
+        return subprocess.run(args, capture_output=True, text=True)
     except FileNotFoundError:
-        print_log(f"❌ File tidak ditemukan: {filename}", "error")
-
-def write_env_file(filename, device_id, token_api, invoice_api, bill_api, log_dir, flask_port):
-    with open(filename, "w") as env_file:
-        env_file.write(f'ID_DEVICE="{device_id}"\n')
-        env_file.write(f'TOKEN_API="{token_api}"\n')
-        env_file.write(f'INVOICE_API="{invoice_api}"\n')
-        env_file.write(f'BILL_API="{bill_api}"\n')
-        env_file.write(f'LOG_DIR="{log_dir}"\n')
-        env_file.write(f'PORT={flask_port}\n')
-
-def configure_files(python_path):
-    """Mengedit file konfigurasi dengan parameter yang diberikan."""
-    print_log("🛠️ Mengonfigurasi file...")
-    replace_line_in_file("billacceptor.service", r'ExecStart=.*', f'ExecStart=/usr/bin/python3 {python_path}/billacceptor.py')
-
-def move_files(python_path, rollback_path):
-    """Memindahkan file ke lokasi yang sesuai."""
-    print_log("📂 Memindahkan file konfigurasi...")
-    run_command("sudo mv billacceptor.service /etc/systemd/system/")
-    run_command(f"sudo mv billacceptor.py {python_path}")
-    run_command(f"sudo mv rollback.py {rollback_path}")
-    run_command(f"sudo mv setup.log {rollback_path}")
-
-def configure_ufw(flask_port):
-    """Mengonfigurasi firewall UFW."""
-    print_log("🔐 Mengonfigurasi UFW...")
-    run_command(f"sudo ufw allow {flask_port}")
-    run_command("sudo ufw enable")
+        return None
 
-def enable_service():
-    """Mengaktifkan service billacceptor."""
-    print_log("🚀 Mengaktifkan service Bill Acceptor...")
-    run_command("sudo systemctl enable billacceptor.service")
-    run_command("sudo systemctl start billacceptor.service")
+def apt_installed(package):
+    result = check_command(["dpkg-query", "-W", "-f=${Status}", package])
+    return bool(result) and "install ok installed" in result.stdout
+
+def pip_installed(package):
+    result = check_command(["pip3", "show", package])
+    return bool(result) and result.returncode == 0
+
+def service_enabled(name):
+    result = check_command(["systemctl", "is-enabled", "--quiet", name])
+    return bool(result) and result.returncode == 0
+
+def ufw_active():
+    result = check_command(["sudo", "ufw", "status"])
+    return bool(result) and "Status: active" in result.stdout
 
-def write_setup_log(filename, data):
-    """Menuliskan data setup ke dalam file log."""
+def ufw_rules():
+    """Rule UFW yang sudah ada di device (aktif maupun belum), mis. {"allow 5000"}."""
+    result = check_command(["sudo", "ufw", "show", "added"])
+    if not result or result.returncode != 0:
+        return set()
+    return {line[len("ufw "):].strip() for line in result.stdout.splitlines() if line.startswith("ufw ")}
+
+def sha256_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+def file_sha256(path):
+    """Checksum file di disk, atau None jika file tidak ada/tidak bisa dibaca."""
     try:
-        with open(filename, "a") as log_file:
-            log_file.write(data + "\n")
-    except PermissionError:
-        print_log(f"❌ Tidak bisa menulis ke {filename}. Coba jalankan dengan sudo.", "error")
-    except Exception as e:
-        print_log(f"Gagal menulis log setup: {e}", "error")
+        with open(path, "rb") as file:
+            return sha256_bytes(file.read())
+    except OSError:
+        return None
+
+def read_manifest(path):
+    """Membaca manifest setup sebelumnya. Mengembalikan manifest kosong jika belum ada."""
+    try:
+        with open(path, "r") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        print_log(f"Manifest {path} tidak bisa dibaca ({e}), dianggap provisioning baru.", "warning")
+        return {}
+
+def write_manifest(path, manifest):
+    """Menulis manifest secara atomik (file sementara lalu rename)."""
+    manifest["updated"] = datetime.datetime.now().isoformat(timespec="seconds")
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(manifest, file, indent=2)
+    os.replace(tmp_path, path)
+    print_log(f"🧾 Manifest ditulis ke: {path}")
+
+def render_env_file(device_id, token_api, invoice_api, bill_api, log_dir, flask_port, extra=None):
+    """Isi .env. `extra` berisi variabel opsional (TIMEOUT, ADMIN_TOKEN, TELEMETRY_URL, ...) dari bagian `env` konfigurasi."""
+    env = (
+        f'ID_DEVICE="{device_id}"\n'
+        f'TOKEN_API="{token_api}"\n'
+        f'INVOICE_API="{invoice_api}"\n'
+        f'BILL_API="{bill_api}"\n'
+        f'LOG_DIR="{log_dir}"\n'
+        f'PORT={flask_port}\n'
+    )
+    for key, value in (extra or {}).items():
+        # Nilai kosong di YAML (None) dilewati agar tidak menjadi string "None"
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            value = 1 if value else 0
+        env += f'{key}="{value}"\n'
+    return env
+
+# Variabel .env yang hanya dibaca billacceptor.py saat startup (CONFIG_FIELDS yang tidak bisa di-reload)
+STARTUP_ENV_KEYS = ["ID_DEVICE", "LOG_DIR", "PORT", "PULSE_TRACE", "TELEMETRY_URL"]
+
+def parse_env(text):
+    """Membaca isi .env hasil render_env_file menjadi dict."""
+    values = {}
+    for line in text.splitlines():
+        key, sep, value = line.partition("=")
+        if sep and not key.lstrip().startswith("#"):
+            values[key.strip()] = value.strip().strip('"')
+    return values
+
+def startup_env_changed(path, data):
+    """True jika variabel startup di .env baru berbeda dengan .env yang terpasang (atau yang lama tidak bisa dibaca)."""
+    try:
+        with open(path, "r") as file:
+            current = parse_env(file.read())
+    except OSError:
+        return True
+    new = parse_env(data.decode())
+    return any(current.get(key) != new.get(key) for key in STARTUP_ENV_KEYS)
+
+def render_service_file(python_path):
+    with open(os.path.join(SOURCE_DIR, SERVICE_NAME), "r") as file:
+        unit = file.read()
+    return re.sub(r'ExecStart=.*', f'ExecStart=/usr/bin/python3 {python_path}/billacceptor.py', unit)
+
+def desired_files(config):
+    """Semua file yang harus ada di device: path tujuan -> (sumber, isi, mode)."""
+    python_path = config["python_path"]
+    rollback_path = config["rollback_path"]
+
+    def source(name):
+        with open(os.path.join(SOURCE_DIR, name), "rb") as file:
+            return file.read()
+
+    env = render_env_file(config["device_id"], config["token_api"], config["invoice_api"],
+                          config["bill_api"], python_path, config["flask_port"], config.get("env"))
+    return {
+        os.path.join(python_path, "billacceptor.py"): ("billacceptor.py", source("billacceptor.py"), "644"),
+        os.path.join(python_path, "denominations.json"): ("denominations.json", source("denominations.json"), "644"),
+        os.path.join(python_path, ".env"): (".env", env.encode(), "600"),
+        os.path.join(rollback_path, "rollback.py"): ("rollback.py", source("rollback.py"), "644"),
+        SERVICE_PATH: (SERVICE_NAME, render_service_file(python_path).encode(), "644"),
+    }
+
+def plan_provisioning(config, manifest):
+    """Membandingkan kondisi yang diinginkan dengan manifest (dan disk) lalu menghasilkan daftar perubahan saja."""
+    files = desired_files(config)
+    old_files = manifest.get("files", {})
+    install = [path for path, (_, data, _) in files.items()
+               if old_files.get(path, {}).get("sha256") != sha256_bytes(data) or file_sha256(path) != sha256_bytes(data)]
+    remove = [path for path in old_files if path not in files]
+
+    # Hanya file billacceptor yang memengaruhi service (bukan rollback.py). Kode atau unit berubah -> restart;
+    # hanya .env/denominations.json berubah -> reload (SIGHUP) agar transaksi yang berjalan tidak terputus
+    changed = [path for path in install + remove
+               if path == SERVICE_PATH or path.startswith(os.path.join(config["python_path"], ""))]
+    env_path = os.path.join(config["python_path"], ".env")
+    reloadable = (env_path, os.path.join(config["python_path"], "denominations.json"))
+    restart = (any(path not in reloadable for path in changed)
+               or (env_path in install and startup_env_changed(env_path, files[env_path][1])))
+
+    # Rule yang sudah ada sebelum setup tidak ditambahkan (dan tidak dicatat) agar tidak ikut dihapus saat rollback
+    # Akses manajemen (default SSH) selalu diizinkan sebelum UFW diaktifkan tanpa prompt
+    rules = [f"allow {config['flask_port']}"] + [f"allow {name}" for name in config.get("firewall_allow", FIREWALL_ALLOW)]
+    old_rules = manifest.get("firewall", {}).get("rules", [])
+    existing_rules = ufw_rules()
+
+    return {
+        "directories": [path for path in (config["python_path"], config["rollback_path"]) if not os.path.isdir(path)],
+        "apt": [package for package in APT_PACKAGES if not apt_installed(package)],
+        "pip": [package for package in PIP_PACKAGES if not pip_installed(package)],
+        "pigpiod": not service_enabled("pigpiod"),
+        "files": {"install": install, "remove": remove, "desired": files},
+        "firewall": {
+            "add": [rule for rule in rules if rule not in old_rules and rule not in existing_rules],
+            "delete": [old for old in old_rules if old not in rules],
+            "enable": not ufw_active(),
+        },
+        "service": {
+            "enable": not service_enabled(SERVICE_NAME),
+            "daemon_reload": SERVICE_PATH in install,
+            "restart": restart,
+            "reload": bool(changed) and not restart,
+        },
+    }
+
+def print_plan(plan):
+    """Mencetak rencana perubahan (dry-run)."""
+    firewall, service = plan["firewall"], plan["service"]
+    actions = (
+        [f"mkdir {path}" for path in plan["directories"]]
+        + [f"apt install {package}" for package in plan["apt"]]
+        + [f"pip install {package}" for package in plan["pip"]]
+        + (["systemctl enable pigpiod"] if plan["pigpiod"] else [])
+        + [f"install {path}" for path in plan["files"]["install"]]
+        + [f"rm {path}" for path in plan["files"]["remove"]]
+        + [f"ufw delete {rule}" for rule in firewall["delete"]]
+        + [f"ufw {rule}" for rule in firewall["add"]]
+        + (["ufw enable"] if firewall["enable"] else [])
+        + (["systemctl daemon-reload"] if service["daemon_reload"] else [])
+        + ([f"systemctl enable {SERVICE_NAME}"] if service["enable"] else [])
+        + ([f"systemctl restart {SERVICE_NAME}"] if service["restart"] or service["enable"]
+           else [f"systemctl reload-or-restart {SERVICE_NAME}"] if service["reload"] else [])
+    )
+    print("\n📋 **Rencana provisioning**\n")
+    for action in actions or ["(tidak ada perubahan)"]:
+        print(f"  - {action}")
+
+def install_apt_packages(packages, bundle_dir=None, upgrade=True):
+    """Menginstal paket apt yang belum ada, dari bundle offline (bundle_dir/debs) jika tersedia."""
+    if not packages:
+        return True
+    if bundle_dir:
+        # Bundle dipakai sebagai satu-satunya sumber apt (tanpa jaringan): apt memilih sendiri paket dan
+        # dependensi yang belum ada. --no-download tidak dipakai karena apt menolak file: source dengan opsi itu.
+        debs = os.path.abspath(os.path.join(bundle_dir, "debs"))
+        with tempfile.NamedTemporaryFile("w", suffix=".list", delete=False) as file:
+            file.write(f"deb [trusted=yes] file:{debs} ./\n")
+            source_list = file.name
+        options = (f"-o Dir::Etc::SourceList={shlex.quote(source_list)} -o Dir::Etc::SourceParts=- "
+                   f"-o APT::Get::List-Cleanup=0")
+        try:
+            return (run_command(f"sudo apt-get update {options}")
+                    and run_command(f"sudo apt-get install -y {options} {' '.join(packages)}"))
+        finally:
+            os.remove(source_list)
+
+    commands = ["sudo apt update"]
+    if upgrade:
+        commands.append("sudo apt upgrade -y")
+    commands.append(f"sudo apt install -y {' '.join(packages)}")
+    return all(run_command(command) for command in commands)
+
+def install_pip_packages(packages, bundle_dir=None):
+    """Menginstal paket Python yang belum ada dalam satu panggilan pip, dari wheelhouse offline jika tersedia."""
+    if not packages:
+        return True
+    source = f"--no-index --find-links {os.path.join(bundle_dir, 'wheels')} " if bundle_dir else ""
+    return run_command(f"sudo pip3 install {source}{' '.join(packages)} --break-system-packages")
+
+def enable_pigpiod():
+    """Menjalankan dan mengaktifkan daemon pigpio."""
+    return run_command("sudo systemctl start pigpiod") and run_command("sudo systemctl enable pigpiod")
+
+def make_bundle(bundle_dir):
+    """Membuat bundle offline (wheels + debs) untuk provisioning tanpa internet. Jalankan di Pi referensi yang terhubung internet.
+
+    debs/ dijadikan repository apt lokal (Packages dari dpkg-scanpackages, paket dpkg-dev).
+    """
+    print_log(f"📦 Membuat bundle offline di {bundle_dir}...")
+    wheels = os.path.join(bundle_dir, "wheels")
+    debs = os.path.join(bundle_dir, "debs")
+    ensure_directory_exists(wheels)
+    ensure_directory_exists(debs)
+    depends = (f"apt-cache depends --recurse --no-recommends --no-suggests --no-conflicts --no-breaks "
+               f"--no-replaces --no-enhances {' '.join(APT_PACKAGES)} | grep '^\\w' | sort -u")
+    ok = run_command(f"pip3 download -d {wheels} {' '.join(PIP_PACKAGES)}")
+    ok = run_command(f"cd {debs} && apt-get download $({depends})") and ok
+    ok = ok and run_command(f"cd {debs} && dpkg-scanpackages . /dev/null > Packages")
+    return ok
+
+def sync_files(plan_files, manifest_files):
+    """Memasang file yang berubah dan menghapus file lama. manifest_files diperbarui sesuai hasilnya."""
+    print_log("📂 Menyinkronkan file...")
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for path in plan_files["install"]:
+            name, data, mode = plan_files["desired"][path]
+            tmp_path = os.path.join(tmp_dir, os.path.basename(path))
+            with open(tmp_path, "wb") as file:
+                file.write(data)
+            if run_command(f"sudo install -D -m {mode} {shlex.quote(tmp_path)} {shlex.quote(path)}"):
+                manifest_files[path] = {"source": name, "sha256": sha256_bytes(data)}
+            else:
+                ok = False
+
+    for path in plan_files["remove"]:
+        if run_command(f"sudo rm -f {shlex.quote(path)}"):
+            manifest_files.pop(path, None)
+        else:
+            ok = False
+    return ok
+
+def configure_ufw(plan_firewall, manifest_firewall):
+    """Mengonfigurasi firewall UFW sesuai rencana."""
+    print_log("🔐 Mengonfigurasi UFW...")
+    ok = True
+    for rule in plan_firewall["delete"]:
+        if run_command(f"sudo ufw delete {rule}"):
+            manifest_firewall["rules"].remove(rule)
+        else:
+            ok = False
+    for rule in plan_firewall["add"]:
+        if run_command(f"sudo ufw {rule}"):
+            manifest_firewall["rules"].append(rule)
+        else:
+            ok = False
+    # Jangan aktifkan UFW jika rule (termasuk SSH) gagal ditambahkan: device bisa tidak terjangkau lagi
+    if plan_firewall["enable"] and ok:
+        if run_command("sudo ufw --force enable"):
+            manifest_firewall["enabled_by_setup"] = True
+        else:
+            ok = False
+    return ok
+
+def enable_service(plan_service):
+    """Mengaktifkan service billacceptor; restart jika kode/unit berubah, reload jika hanya konfigurasi yang berubah."""
+    print_log("🚀 Mengaktifkan service Bill Acceptor...")
+    commands = []
+    if plan_service["daemon_reload"]:
+        commands.append("sudo systemctl daemon-reload")
+    if plan_service["enable"]:
+        commands.append(f"sudo systemctl enable {SERVICE_NAME}")
+    if plan_service["restart"] or plan_service["enable"]:
+        commands.append(f"sudo systemctl restart {SERVICE_NAME}")
+    elif plan_service["reload"]:
+        commands.append(f"sudo systemctl reload-or-restart {SERVICE_NAME}")
+    return all(run_command(command) for command in commands)
 
 def ensure_directory_exists(directory):
     """Membuat folder jika belum ada."""
@@ -187,6 +431,75 @@ def ensure_directory_exists(directory):
     else:
         print_log(f"✅ Folder sudah ada: {directory}")
 
+CONFIG_KEYS = ["device_id", "token_api", "invoice_api", "bill_api", "python_path", "flask_port", "rollback_path"]
+
+def load_config(path, device=None):
+    """Membaca file konfigurasi unattended (YAML/JSON). Bagian `devices` berisi override per device (key: hostname/ID)."""
+    with open(path, "r") as file:
+        if path.endswith((".yaml", ".yml")):
+            try:
+                import yaml
+            except ImportError:
+                print_log("PyYAML tidak terinstal (sudo apt install python3-yaml), gunakan file .json.", "error")
+                sys.exit(1)
+            data = yaml.safe_load(file) or {}
+        else:
+            data = json.load(file)
+
+    devices = data.pop("devices", None) or {}
+    device = device or socket.gethostname()
+    override = devices.get(device, {})
+    config = {**data, **override}
+    # `env` digabung per variabel: override device hanya mengganti variabel yang disebutkan
+    config["env"] = {**(data.get("env") or {}), **(override.get("env") or {})}
+
+    missing = [key for key in CONFIG_KEYS if not config.get(key)]
+    if missing:
+        print_log(f"Konfigurasi untuk device '{device}' belum lengkap: {', '.join(missing)}", "error")
+        sys.exit(1)
+    return config
+
+def prompt_config():
+    """Menanyakan konfigurasi secara interaktif."""
+    return {
+        "device_id": input("Masukkan ID Device: "),
+        "token_api": input("Masukkan URL TOKEN_API: "),
+        "invoice_api": input("Masukkan URL INVOICE_API: "),
+        "bill_api": input("Masukkan URL BILL_API: "),
+        "python_path": input("Masukkan path penyimpanan billacceptor.py: "),
+        "flask_port": input("Masukkan port Flask: "),
+        "rollback_path": input("Masukkan path penyimpanan rollback.py: "),
+    }
+
+def run_steps(steps):
+    """Menjalankan langkah-langkah setup secara paralel sesuai dependensinya dan mencetak durasi tiap langkah.
+
+    steps: dict nama -> (fungsi, [nama langkah yang harus selesai dulu]), dependensi ditulis lebih dulu.
+    """
+    futures = {}
+    timings = {}
+
+    def run(name, func, deps):
+        for dep in deps:
+            if not futures[dep].result():
+                print_log(f"⏭️ {name} dilewati karena {dep} gagal.", "warning")
+                return False
+        start = time.monotonic()
+        ok = bool(func())
+        timings[name] = time.monotonic() - start
+        print_log(f"⏱️ {name}: {timings[name]:.1f} detik ({'ok' if ok else 'gagal'})", "info" if ok else "error")
+        return ok
+
+    start = time.monotonic()
+    # Satu worker per langkah: langkah yang menunggu dependensi tidak pernah memblokir langkah lain
+    with ThreadPoolExecutor(max_workers=len(steps)) as pool:
+        for name, (func, deps) in steps.items():
+            futures[name] = pool.submit(run, name, func, deps)
+        results = {name: future.result() for name, future in futures.items()}
+
+    print_log(f"⏱️ Total: {time.monotonic() - start:.1f} detik (jumlah per langkah: {sum(timings.values()):.1f} detik)")
+    return all(results.values())
+
 def lmxugmxpolinema(ascii1, ascii2, watermark="--**UGM x POLINEMA**--"):
     lines1 = ascii1.strip('\n').split('\n')
     lines2 = ascii2.strip('\n').split('\n')
@@ -210,50 +523,71 @@ def lmxugmxpolinema(ascii1, ascii2, watermark="--**UGM x POLINEMA**--"):
     print("\n".join(output_lines))
 
 if __name__ == "__main__":
-    setup_log_file = "setup.log"
-    
-    lmxugmxpolinema(ugm, polinema)
-    print("\n🔧 **Setup Bill Acceptor**\n")
-
-    # Input dari pengguna
-    device_id = input("Masukkan ID Device: ")
-    write_setup_log(setup_log_file, f"ID_DEVICE: {device_id}")
-
-    token_api = input("Masukkan URL TOKEN_API: ")
-    write_setup_log(setup_log_file, f"TOKEN_API: {token_api}")
-
-    invoice_api = input("Masukkan URL INVOICE_API: ")
-    write_setup_log(setup_log_file, f"INVOICE_API: {invoice_api}")
+    parser = argparse.ArgumentParser(description="Setup Bill Acceptor")
+    parser.add_argument("--config", help="File konfigurasi YAML/JSON untuk mode unattended")
+    parser.add_argument("--device", help="Nama device di bagian `devices` file konfigurasi (default: hostname)")
+    parser.add_argument("--bundle", help="Direktori bundle offline (wheels/ dan debs/)")
+    parser.add_argument("--make-bundle", metavar="DIR", help="Buat bundle offline di DIR lalu keluar")
+    parser.add_argument("--dry-run", action="store_true", help="Tampilkan rencana perubahan tanpa menjalankannya")
+    args = parser.parse_args()
 
-    bill_api = input("Masukkan URL BILL_API: ")
-    write_setup_log(setup_log_file, f"BILL_API: {bill_api}")
+    if args.make_bundle:
+        sys.exit(0 if make_bundle(args.make_bundle) else 1)
 
-    python_path = input("Masukkan path penyimpanan billacceptor.py: ")
-    ensure_directory_exists(python_path)
-    write_setup_log(setup_log_file, f"Python Path: {python_path}")
-
-    log_dir = python_path
-    print_log(f"📁 LOG_DIR disetel ke: {log_dir}")
-    write_setup_log(setup_log_file, f"LOG_DIR: {log_dir}")
-
-    flask_port = input("Masukkan port Flask: ")
-    write_setup_log(setup_log_file, f"Flask Port: {flask_port}")
-
-    rollback_path = input("Masukkan path penyimpanan rollback.py: ")
-    ensure_directory_exists(rollback_path)
-    write_setup_log(setup_log_file, f"Rollback Path: {rollback_path}")
-
-    # Tulis file .env
-    env_path = os.path.join(python_path, ".env")
-    write_env_file(env_path, device_id, token_api, invoice_api, bill_api, log_dir, flask_port)
-    print_log(f"✅ File .env berhasil dibuat di: {env_path}")
+    lmxugmxpolinema(ugm, polinema)
+    print("\n🔧 **Setup Bill Acceptor**\n")
 
-    # Jalankan semua fungsi
-    install_dependencies()
-    configure_files(python_path)
-    move_files(python_path, rollback_path)
-    configure_ufw(flask_port)
-    enable_service()
+    # Input dari file konfigurasi atau dari pengguna
+    config = load_config(args.config, args.device) if args.config else prompt_config()
+    config["flask_port"] = str(config["flask_port"])
+    bundle_dir = args.bundle or config.get("bundle")
+    print_log(f"📁 LOG_DIR disetel ke: {config['python_path']}")
+
+    # Bandingkan dengan manifest provisioning sebelumnya
+    manifest_path = os.path.join(config["rollback_path"], MANIFEST_FILE)
+    manifest = read_manifest(manifest_path)
+    upgrade = config.get("apt_upgrade", not bundle_dir and not manifest)
+    plan = plan_provisioning(config, manifest)
+
+    if args.dry_run:
+        print_plan(plan)
+        sys.exit(0)
+
+    for directory in (config["python_path"], config["rollback_path"]):
+        ensure_directory_exists(directory)
+
+    packages = manifest.get("packages", {})
+    new_manifest = {
+        "version": 1,
+        "config": {key: config[key] for key in CONFIG_KEYS},
+        "directories": sorted(set(manifest.get("directories", [])) | set(plan["directories"])),
+        "files": dict(manifest.get("files", {})),
+        "packages": {"apt": list(packages.get("apt", [])), "pip": list(packages.get("pip", []))},
+        "services": list(manifest.get("services", [])),
+        "firewall": {"rules": list(manifest.get("firewall", {}).get("rules", [])),
+                     "enabled_by_setup": manifest.get("firewall", {}).get("enabled_by_setup", False)},
+    }
+
+    def record(section, names, ok):
+        """Mencatat artefak yang dibuat setup (hanya yang sebelumnya belum ada) ke manifest."""
+        if ok:
+            section.extend(name for name in names if name not in section)
+        return ok
+
+    # Jalankan hanya perubahan; instalasi dependensi berjalan bersamaan dengan sinkronisasi file
+    ok = run_steps({
+        "apt": (lambda: record(new_manifest["packages"]["apt"], plan["apt"], install_apt_packages(plan["apt"], bundle_dir, upgrade)), []),
+        "pip": (lambda: record(new_manifest["packages"]["pip"], plan["pip"], install_pip_packages(plan["pip"], bundle_dir)), ["apt"]),
+        "pigpiod": (lambda: record(new_manifest["services"], ["pigpiod"], enable_pigpiod()) if plan["pigpiod"] else True, []),
+        "files": (lambda: sync_files(plan["files"], new_manifest["files"]), []),
+        "ufw": (lambda: configure_ufw(plan["firewall"], new_manifest["firewall"]), ["apt"]),
+        "service": (lambda: record(new_manifest["services"], [SERVICE_NAME] if plan["service"]["enable"] else [], enable_service(plan["service"])), ["pip", "pigpiod", "files", "ufw"]),
+    })
+    write_manifest(manifest_path, new_manifest)
+
+    if not ok:
+        print_log("Setup selesai dengan error, periksa log di atas.", "error")
+        sys.exit(1)
 
     print("\n🎉 **Setup selesai! Bill Acceptor sudah terinstal dan berjalan.** 🎉")
     print_log("🎉 Setup selesai! Bill Acceptor sudah terinstal dan berjalan.")
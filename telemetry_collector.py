@@ -0,0 +1,120 @@
+import os
+import re
+import gzip
+import json
+import zlib
+import argparse
+import datetime
+import threading
+from flask import Flask, request, jsonify
+
+# REFERENCE COLLECTOR UNTUK TELEMETRY UPLINK
+# Menerima batch dari billacceptor.py (TELEMETRY_URL=http://<host>:<port>/api/telemetry)
+# dan menyimpannya per device sebagai JSON Lines: <data_dir>/<ID_DEVICE>/<YYYYMMDD>.jsonl
+
+app = Flask(__name__)
+
+DATA_DIR = "telemetry_data"
+TELEMETRY_TOKEN = os.getenv("TELEMETRY_TOKEN")
+DEVICE_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]*$")
+
+devices = {}
+devices_lock = threading.Lock()
+
+def device_data_dir(device):
+    """Direktori data device di dalam DATA_DIR, atau None jika ID_DEVICE tidak valid."""
+    if not isinstance(device, str) or not DEVICE_PATTERN.match(device):
+        return None
+    root = os.path.realpath(DATA_DIR)
+    path = os.path.realpath(os.path.join(root, device))
+    return path if os.path.dirname(path) == root else None
+
+def read_batches(path):
+    """Membaca file JSON Lines; baris yang rusak (mis. tulisan terpotong) dilewati."""
+    batches = []
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                batch = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(batch, dict):
+                batches.append(batch)
+    return batches
+
+@app.route('/api/telemetry', methods=['POST'])
+def ingest_telemetry():
+    if TELEMETRY_TOKEN and request.headers.get("X-Telemetry-Token") != TELEMETRY_TOKEN:
+        return jsonify({"status": "error", "message": "Tidak diizinkan"}), 403
+
+    try:
+        body = request.get_data()
+        if request.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        batch = json.loads(body)
+    except (OSError, EOFError, zlib.error, ValueError) as e:
+        return jsonify({"status": "error", "message": f"Batch tidak valid: {e}"}), 400
+    if not isinstance(batch, dict):
+        return jsonify({"status": "error", "message": "Batch harus berupa objek JSON"}), 400
+
+    device = batch.get("device")
+    device_dir = device_data_dir(device)
+    if device_dir is None:
+        return jsonify({"status": "error", "message": "ID_DEVICE tidak valid"}), 400
+
+    received_at = datetime.datetime.now()
+    os.makedirs(device_dir, exist_ok=True)
+    with devices_lock:
+        with open(os.path.join(device_dir, received_at.strftime("%Y%m%d") + ".jsonl"), "a") as f:
+            f.write(json.dumps({**batch, "received_at": received_at.isoformat(timespec="seconds")}) + "\n")
+
+        # Batch lama yang dikirim ulang dari spool tidak boleh menimpa status terbaru
+        latest = devices.get(device)
+        if latest is None or str(batch.get("sent_at") or "") > str(latest["sent_at"] or ""):
+            devices[device] = {
+                "last_seen": received_at.isoformat(timespec="seconds"),
+                "sent_at": batch.get("sent_at"),
+                "metrics": batch.get("metrics"),
+                "stats": batch.get("stats"),
+            }
+        else:
+            latest["last_seen"] = received_at.isoformat(timespec="seconds")
+
+    transactions = batch.get("transactions")
+    return jsonify({"status": "success", "received": len(transactions) if isinstance(transactions, list) else 0}), 200
+
+@app.route('/api/devices', methods=['GET'])
+def get_devices():
+    with devices_lock:
+        return jsonify(devices)
+
+@app.route('/api/devices/<device>/payment_logs', methods=['GET'])
+def get_device_payment_logs(device):
+    device_dir = device_data_dir(device)
+    if device_dir is None:
+        return jsonify({"status": "error", "message": "ID_DEVICE tidak valid"}), 400
+
+    limit = request.args.get("limit", 10, type=int)
+    if not os.path.isdir(device_dir):
+        return jsonify({"status": "error", "message": "Device tidak ditemukan"}), 404
+
+    logs = []
+    for name in sorted((name for name in os.listdir(device_dir) if name.endswith(".jsonl")), reverse=True):
+        batches = sorted(read_batches(os.path.join(device_dir, name)), key=lambda batch: str(batch.get("sent_at") or ""))
+        for batch in reversed(batches):
+            logs[:0] = [f"[{record.get('time')}] {record.get('message')}" for record in batch.get("transactions") or []
+                        if isinstance(record, dict)]
+        if len(logs) >= limit:
+            break
+
+    return jsonify({"status": "success", "logs": logs[-limit:]}), 200
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reference collector telemetry Bill Acceptor")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--data-dir", default=DATA_DIR, help="Direktori penyimpanan batch per device")
+    args = parser.parse_args()
+
+    DATA_DIR = args.data_dir
+    app.run(host=args.host, port=args.port, debug=False, use_reloader=False)